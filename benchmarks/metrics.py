@@ -1,11 +1,21 @@
-import time
 import csv
 import json
+import logging
 import os
 from datetime import datetime
-from typing import Dict, List, Any
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Union
+from dataclasses import dataclass, fields
 import threading
+import queue
+from collections import defaultdict, deque
+from operator import attrgetter
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger("bench")
 
 @dataclass
 class BenchmarkResult:
@@ -19,95 +29,220 @@ class BenchmarkResult:
     total_tokens: int
     timestamp: str
     query_prompt: str
-    response_data: str
+    response_data: Union[str, dict]  # Raw response dicts are serialized by MetricsCollector
     is_correct: bool = False
     iterations: int = 1  # Number of turns in multi-turn mode, default 1 for single-turn
     edited_content: str = ""  # The actual edited file content
 
+# Column order for the CSV summary and the per-record fields kept in the detailed logs
+_CSV_FIELDS = (
+    'benchmark_id', 'model', 'file', 'query_id', 'method',
+    'time_generate_ms', 'time_apply_ms',
+    'total_tokens', 'timestamp', 'is_correct', 'iterations'
+)
+_LOG_FIELDS = tuple(f.name for f in fields(BenchmarkResult) if f.name != 'edited_content')
+# Reads a result's CSV columns as a positional tuple in one call
+_csv_row = attrgetter(*_CSV_FIELDS)
+
+# Sentinel that tells the workspace writer thread to exit
+_STOP_WRITER = object()
+
+# Raw flags for workspace files (O_BINARY only exists, and matters, on Windows)
+_WORKSPACE_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+
+# Large stdio buffer so result files are written with few syscalls
+_WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+
+# Encoded records a worker thread buffers before taking the file lock
+_THREAD_BUFFER_SIZE = 32
+
+# Shared stdlib encoders for when orjson is unavailable (json.dumps builds a new one per
+# call), configured to produce the same compact, non-ASCII-escaped output orjson does
+_JSON_ENCODER = json.JSONEncoder(indent=2, ensure_ascii=False)
+_COMPACT_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+def _dumps_response(response_data) -> str:
+    if isinstance(response_data, str):
+        return response_data
+    if orjson is not None:
+        return orjson.dumps(response_data).decode("utf-8")
+    return _COMPACT_JSON_ENCODER.encode(response_data)
+
+def _encode_log_record(record: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return _JSON_ENCODER.encode(record).encode("utf-8")
+
 class MetricsCollector:
     def __init__(self, output_dir: str = "results/", test_type: str = "multi_turn"):
         self.test_type = test_type
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.timestamp = timestamp
         self.output_dir = os.path.join(output_dir, f"benchmark_{timestamp}_{test_type}")
-        self.results: List[BenchmarkResult] = []
-        # Thread-safe append with a lock ensures consistency when used from multiple threads
+        # Only the fields generate_summary needs are kept in memory; full records
+        # are streamed to the CSV and detailed log as they arrive. deque.append is
+        # thread-safe, so recording stats needs no lock
+        self._stats: deque = deque()
+        # Encoded (row, log record) pairs are buffered per thread and written in
+        # blocks; the lock only serializes access to the shared CSV/log handles
+        self._tls = threading.local()
+        self._thread_buffers: List[list] = []
         self._lock = threading.Lock()
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(os.path.join(self.output_dir, "logs"), exist_ok=True)
         self.workspace_dir = os.path.join(self.output_dir, "workspace")
         os.makedirs(self.workspace_dir, exist_ok=True)
+        self.csv_path = os.path.join(self.output_dir, f"benchmark_{timestamp}_{test_type}.csv")
+        self._csv_file = open(self.csv_path, 'w', newline='', buffering=_WRITE_BUFFER_SIZE)
+        self._csv_writer = csv.writer(self._csv_file)
+        self._csv_writer.writerow(_CSV_FIELDS)
+        # The detailed log stays a single JSON array: records are appended as they
+        # arrive and the closing bracket is written by save_detailed_logs
+        self.log_path = os.path.join(self.output_dir, "logs", f"detailed_{timestamp}_{test_type}.json")
+        self._log_file = open(self.log_path, 'wb', buffering=_WRITE_BUFFER_SIZE)
+        self._log_file.write(b"[")
+        self._num_logged = 0
+        # Workspace filename suffix per method; the test type is fixed per collector
+        self._method_suffix = {
+            "full_file_generation": "full_file",
+            "search_replace": "search_replace",
+        }
+        if test_type == "single_turn":
+            self._method_suffix["morph"] = "morph_single"
+        elif test_type == "multi_turn":
+            self._method_suffix["morph"] = "morph_multi"
+        # result.file -> (name without extension, extension)
+        self._file_parts_cache: Dict[str, tuple] = {}
+        # (model, file name without extension) -> created workspace directory
+        self._dir_cache: Dict[tuple, str] = {}
+        # Edited files are written to the workspace by a background thread so
+        # worker threads never wait on disk I/O while holding the lock
+        self._write_queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._drain_writes, daemon=True)
+        self._writer.start()
     
     def add_result(self, result: BenchmarkResult):
         """Thread-safe addition of a result record."""
+        row = _csv_row(result)
+        log_record = {name: getattr(result, name) for name in _LOG_FIELDS}
+        log_record['response_data'] = _dumps_response(result.response_data)
+        record = _encode_log_record(log_record)
+        stats = (
+            result.model, result.method, result.time_generate_ms, result.time_apply_ms,
+            result.total_tokens, result.iterations, result.is_correct
+        )
+        self._stats.append(stats)
+        buffer = getattr(self._tls, "buffer", None)
+        if buffer is None:
+            buffer = self._tls.buffer = []
+            with self._lock:
+                self._thread_buffers.append(buffer)
+        buffer.append((row, record))
+        if len(buffer) >= _THREAD_BUFFER_SIZE:
+            with self._lock:
+                self._write_buffered(buffer)
+        # Save the edited file to workspace
+        if result.edited_content:
+            self._write_queue.put(result)
+    
+    def flush(self):
+        """Write out records still buffered by any thread."""
         with self._lock:
-            self.results.append(result)
-            # Save the edited file to workspace
-            if result.edited_content:
+            for buffer in self._thread_buffers:
+                self._write_buffered(buffer)
+    
+    def _write_buffered(self, buffer: list):
+        # Caller holds self._lock. Only the records seen here are removed, so an
+        # append racing with this write stays in the buffer for the next one.
+        # Once the files are finished (e.g. after an aborted run) records are
+        # dropped rather than written past the closing bracket
+        if self._csv_file.closed or self._log_file.closed:
+            return
+        pending = buffer[:]
+        del buffer[:len(pending)]
+        self._csv_writer.writerows(row for row, _ in pending)
+        for _, record in pending:
+            self._log_file.write(b",\n" if self._num_logged else b"\n")
+            self._log_file.write(record)
+            self._num_logged += 1
+    
+    def close(self):
+        """Wait for pending workspace writes and stop the writer thread."""
+        if self._writer.is_alive():
+            self._write_queue.put(_STOP_WRITER)
+            self._writer.join()
+    
+    def _drain_writes(self):
+        while True:
+            result = self._write_queue.get()
+            if result is _STOP_WRITER:
+                return
+            try:
                 self._save_edited_file(result)
+            except Exception as e:
+                logger.warning(f"Failed to save edited file for {result.query_id} ({result.method}): {e}")
     
     def save_to_csv(self, filename: str = None):
-        if filename is None:
-            filename = f"benchmark_{self.timestamp}_{self.test_type}.csv"
-        
-        filepath = os.path.join(self.output_dir, filename)
-        
-        with open(filepath, 'w', newline='') as csvfile:
-            fieldnames = [
-                'benchmark_id', 'model', 'file', 'query_id', 'method',
-                'time_generate_ms', 'time_apply_ms',
-                'total_tokens', 'timestamp', 'is_correct', 'iterations'
-            ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for result in self.results:
-                row = asdict(result)
-                row.pop('query_prompt')
-                row.pop('response_data')
-                # Ensure extra fields like edited_content are not written to CSV
-                row.pop('edited_content', None)
-                writer.writerow(row)
+        """Flush and close the streamed CSV, optionally renaming it to *filename*."""
+        self.flush()
+        with self._lock:
+            if not self._csv_file.closed:
+                self._csv_file.close()
+            if filename is not None:
+                filepath = os.path.join(self.output_dir, filename)
+                if filepath != self.csv_path:
+                    os.replace(self.csv_path, filepath)
+                    self.csv_path = filepath
         
-        return filepath
+        return self.csv_path
     
     def save_detailed_logs(self):
-        log_file = os.path.join(self.output_dir, "logs", f"detailed_{self.timestamp}_{self.test_type}.json")
-        
-        # Create a copy of results without edited_content for the log
-        log_results = []
-        for r in self.results:
-            r_dict = asdict(r)
-            r_dict.pop('edited_content', None)  # Remove edited_content from logs
-            log_results.append(r_dict)
-        
-        with open(log_file, 'w') as f:
-            json.dump(log_results, f, indent=2)
+        """Terminate the streamed JSON array and close the detailed log (once; repeat
+        calls just return the path)."""
+        self.flush()
+        with self._lock:
+            if not self._log_file.closed:
+                self._log_file.write(b"\n]\n" if self._num_logged else b"]\n")
+                self._log_file.close()
         
-        return log_file
+        return self.log_path
     
     def generate_summary(self):
-        if not self.results:
+        if not self._stats:
             return "No results to summarize"
         
         summary = {}
         
-        methods = set(r.method for r in self.results)
-        models = set(r.model for r in self.results)
+        # One pass over the results: per (model, method) running sums of
+        # [time_generate_ms, time_apply_ms, total_tokens, iterations, n_correct, n]
+        acc = defaultdict(lambda: [0, 0, 0, 0, 0, 0])
+        # Snapshot so results added concurrently don't invalidate the iteration
+        for model, method, time_generate_ms, time_apply_ms, total_tokens, iterations, is_correct in list(self._stats):
+            sums = acc[(model, method)]
+            sums[0] += time_generate_ms
+            sums[1] += time_apply_ms
+            sums[2] += total_tokens
+            sums[3] += iterations
+            sums[4] += 1 if is_correct else 0
+            sums[5] += 1
+        
+        methods = {method for _, method in acc}
+        models = {model for model, _ in acc}
         
         for model in models:
             summary[model] = {}
             for method in methods:
-                method_results = [r for r in self.results if r.model == model and r.method == method]
+                sums = acc.get((model, method))
                 
-                if method_results:
+                if sums:
+                    n = sums[5]
                     summary[model][method] = {
-                        "avg_time_generate_ms": sum(r.time_generate_ms for r in method_results) / len(method_results),
-                        "avg_time_apply_ms": sum(r.time_apply_ms for r in method_results) / len(method_results),
-                        "avg_total_tokens": sum(r.total_tokens for r in method_results) / len(method_results),
-                        "avg_iterations": sum(r.iterations for r in method_results) / len(method_results),
-                        "success_rate": sum(1 for r in method_results if r.is_correct) / len(method_results),
-                        "num_samples": len(method_results)
+                        "avg_time_generate_ms": sums[0] / n,
+                        "avg_time_apply_ms": sums[1] / n,
+                        "avg_total_tokens": sums[2] / n,
+                        "avg_iterations": sums[3] / n,
+                        "success_rate": sums[4] / n,
+                        "num_samples": n
                     }
         
         comparison = {}
@@ -130,50 +265,32 @@ class MetricsCollector:
     def _save_edited_file(self, result: BenchmarkResult):
         """Save the edited file content to the workspace directory."""
         # Extract base filename without path and extension
-        import os.path
-        base_name = os.path.basename(result.file)
-        name_without_ext = os.path.splitext(base_name)[0]
-        file_ext = os.path.splitext(base_name)[1]
-        
-        # Create model directory
-        model_dir = os.path.join(self.workspace_dir, result.model)
-        os.makedirs(model_dir, exist_ok=True)
+        file_parts = self._file_parts_cache.get(result.file)
+        if file_parts is None:
+            file_parts = os.path.splitext(os.path.basename(result.file))
+            self._file_parts_cache[result.file] = file_parts
+        name_without_ext, file_ext = file_parts
         
-        # Create file-specific directory (e.g., 'day', 'canvas', etc.)
-        file_dir = os.path.join(model_dir, name_without_ext)
-        os.makedirs(file_dir, exist_ok=True)
+        # Create the model/file-specific directory (e.g., 'day', 'canvas', etc.) once per pair
+        dir_key = (result.model, name_without_ext)
+        file_dir = self._dir_cache.get(dir_key)
+        if file_dir is None:
+            file_dir = os.path.join(self.workspace_dir, result.model, name_without_ext)
+            os.makedirs(file_dir, exist_ok=True)
+            self._dir_cache[dir_key] = file_dir
         
         # Determine file suffix based on method
-        method_suffix = result.method
-        if result.method == "full_file_generation":
-            method_suffix = "full_file"
-        elif result.method == "morph" and self.test_type == "single_turn":
-            method_suffix = "morph_single"
-        elif result.method == "morph" and self.test_type == "multi_turn":
-            method_suffix = "morph_multi"
-        elif result.method == "search_replace":
-            method_suffix = "search_replace"
+        method_suffix = self._method_suffix.get(result.method, result.method)
         
         # Create filename: query_id_method.extension
         output_filename = f"{result.query_id}_{method_suffix}{file_ext}"
         output_path = os.path.join(file_dir, output_filename)
         
-        # Write the edited content
-        with open(output_path, 'w') as f:
-            f.write(result.edited_content)
-
-class Timer:
-    def __init__(self):
-        self.start_time = None
-        self.end_time = None
-    
-    def start(self):
-        self.start_time = time.time()
-    
-    def stop(self):
-        self.end_time = time.time()
-    
-    def get_duration_ms(self) -> float:
-        if self.start_time and self.end_time:
-            return (self.end_time - self.start_time) * 1000
-        return 0
+        # Write the edited content straight to the fd; it is already fully in memory
+        data = memoryview(result.edited_content.encode('utf-8'))
+        fd = os.open(output_path, _WORKSPACE_OPEN_FLAGS, 0o644)
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
@@ -1,35 +1,57 @@
+import functools
+
+# Static prompt text is built once at import; each builder only joins the
+# per-call pieces (query, filename, file contents) between these fragments.
+_MORPH_PREFIX = "Call the morph tool to make the required changes. You must provide ALL edits in a SINGLE tool call. The file will NOT be shown to you again after your edits, do not look for confirmation or ask clarifications. Instruction: "
+_MORPH_FILE_NAME_SEP = "\n\nfile name: "
+_MORPH_FILE_CONTENT_SEP = "\n\nfile content: "
+
+_SR_PREFIX = (
+    "Call the edit_file tool to make the required changes. You have been shown the ENTIRE file content.\n"
+    "CRITICAL INSTRUCTIONS:\n"
+    "1. You have ONLY ONE CHANCE to edit - no follow-ups, no corrections\n"
+    "2. You MUST provide ALL necessary edits in a SINGLE tool call, do not stop until all required edits have been provided\n"
+    "3. Use the 'edits' array to specify all changes as old_string/new_string pairs\n"
+    "4. The file will NOT be shown to you again after your edits, do not look for confirmation\n"
+    "5. Each edit is applied sequentially, so later edits see the results of earlier ones\n\n"
+    "instruction: "
+)
+_SR_FILE_CONTENT_SEP = "\n\nfile content:\n"
+
+_FULL_FILE_PREFIX = (
+    "You are given a file and a user request to modify it.\n"
+    "Your task is to output the COMPLETE file with the requested changes applied.\n\n"
+    "CRITICAL INSTRUCTIONS:\n"
+    "1. Output the ENTIRE file - do not skip or abbreviate any sections\n"
+    "2. Do not use ellipsis (...) or placeholders like 'rest of code unchanged'\n"
+    "3. Apply ONLY the changes requested by the user\n"
+    "4. Preserve all functionality that is not related to the user's request\n"
+    "5. Maintain the exact same formatting, style, and structure except where changes are needed\n"
+    "6. If a section is unrelated to the user's request, it must remain EXACTLY as it was\n\n"
+    "User request: "
+)
+_FULL_FILE_CONTENT_SEP = "\n\nOriginal file content:\n"
+_FULL_FILE_SUFFIX = "\n\nOutput the complete modified file below:"
+
+# Every model is sent the same full-file prompt for a given (file, query), so that
+# builder is memoized; str hashes are cached on the object, making hits on large files cheap
+_PROMPT_CACHE_SIZE = 128
+
+
 def get_morph_prompt(file_contents: str, filename: str, query: str) -> str:
-    return f"Call the morph tool to make the required changes. You must provide ALL edits in a SINGLE tool call. The file will NOT be shown to you again after your edits, do not look for confirmation or ask clarifications. Instruction: {query}\n\nfile name: {filename}\n\nfile content: {file_contents}"
+    return "".join(
+        (_MORPH_PREFIX, query, _MORPH_FILE_NAME_SEP, filename, _MORPH_FILE_CONTENT_SEP, file_contents)
+    )
 
 
 def get_sr_prompt(file_contents: str, query: str) -> str:
-    return (
-        f"Call the edit_file tool to make the required changes. You have been shown the ENTIRE file content.\n"
-        f"CRITICAL INSTRUCTIONS:\n"
-        f"1. You have ONLY ONE CHANCE to edit - no follow-ups, no corrections\n"
-        f"2. You MUST provide ALL necessary edits in a SINGLE tool call, do not stop until all required edits have been provided\n"
-        f"3. Use the 'edits' array to specify all changes as old_string/new_string pairs\n"
-        f"4. The file will NOT be shown to you again after your edits, do not look for confirmation\n"
-        f"5. Each edit is applied sequentially, so later edits see the results of earlier ones\n\n"
-        f"instruction: {query}\n\n"
-        f"file content:\n{file_contents}"
-    )
+    return "".join((_SR_PREFIX, query, _SR_FILE_CONTENT_SEP, file_contents))
 
 
+@functools.lru_cache(maxsize=_PROMPT_CACHE_SIZE)
 def get_full_file_prompt(file_contents: str, query: str) -> str:
-    return (
-        f"You are given a file and a user request to modify it.\n"
-        f"Your task is to output the COMPLETE file with the requested changes applied.\n\n"
-        f"CRITICAL INSTRUCTIONS:\n"
-        f"1. Output the ENTIRE file - do not skip or abbreviate any sections\n"
-        f"2. Do not use ellipsis (...) or placeholders like 'rest of code unchanged'\n"
-        f"3. Apply ONLY the changes requested by the user\n"
-        f"4. Preserve all functionality that is not related to the user's request\n"
-        f"5. Maintain the exact same formatting, style, and structure except where changes are needed\n"
-        f"6. If a section is unrelated to the user's request, it must remain EXACTLY as it was\n\n"
-        f"User request: {query}\n\n"
-        f"Original file content:\n{file_contents}\n\n"
-        f"Output the complete modified file below:"
+    return "".join(
+        (_FULL_FILE_PREFIX, query, _FULL_FILE_CONTENT_SEP, file_contents, _FULL_FILE_SUFFIX)
     )
 
 
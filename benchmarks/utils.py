@@ -5,39 +5,112 @@ Contains functions for running edits, calculating tokens, and verifying results.
 
 import os
 import difflib
+import itertools
+from collections import deque
+import functools
+import hashlib
+import inspect
+import logging
+import threading
 import anthropic
 import dotenv
 from anthropic.types import ToolParam
 import json
-from openai import OpenAI
+from openai import OpenAI, DefaultHttpxClient
 import time
 import random
+from benchmarks import prompts
 from benchmarks.prompts import JUDGMENT_PROMPT, get_full_file_prompt
-from google import genai
-from google.genai import types
 import tiktoken
 
 
 dotenv.load_dotenv()
-api_key = os.getenv("ANTHROPIC_API_KEY")
 
-client = anthropic.Anthropic(api_key=api_key)
+# Same logger as the runner, so worker-thread messages go through its log queue
+logger = logging.getLogger("bench")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    """Load the cl100k_base encoding once; failures are not cached and retry."""
+    return tiktoken.get_encoding("cl100k_base")
+
 
 def count_tokens(text: str) -> int:
     """
     Count tokens in text using tiktoken.
     Uses cl100k_base encoding for consistent counting across all models.
     """
+    if not text:
+        return 0
     try:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(text))
+        return len(_get_encoding().encode(text))
     except Exception:
         return len(text) // 4
 
-client_morph = OpenAI(
-    api_key=os.getenv("MORPH_API_KEY"),
-    base_url="https://api.morphllm.com/v1",
-)
+
+def _create_once(factory):
+    """Memoize a no-argument client factory so every thread gets one shared instance.
+
+    Unlike functools.lru_cache, construction is locked, so pool threads racing on the
+    first call can't each build a client (and its connection pool). Failures are not
+    cached and retry on the next call.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    return get
+
+
+# API clients are created on first use and then shared, so importing this module
+# neither builds HTTP sessions nor needs keys for providers that a run never calls
+@_create_once
+def _get_anthropic_client():
+    """Create the Anthropic client (also used for the judge) on first use."""
+    return anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+
+@_create_once
+def _get_openai_http_client():
+    """Connection pool shared by every OpenAI-SDK client (Morph and OpenAI models)."""
+    return DefaultHttpxClient()
+
+
+@_create_once
+def _get_morph_client():
+    """Create the Morph apply client on first use."""
+    return OpenAI(
+        api_key=os.getenv("MORPH_API_KEY"),
+        base_url="https://api.morphllm.com/v1",
+        http_client=_get_openai_http_client(),
+    )
+
+
+@_create_once
+def _get_openai_client():
+    """Create the OpenAI client on first use; later calls reuse it instead of rebuilding it."""
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"), http_client=_get_openai_http_client()
+    )
+
+
+@_create_once
+def _get_genai_client():
+    """Create the Gemini client on first use so its connection pool is shared by all calls."""
+    # google-genai is imported here, not at module level: it is slow to import and
+    # only runs that include a Gemini model need it
+    from google import genai
+
+    return genai.Client()
+
 
 MORPH_TOOL: ToolParam = {
     "name": "edit_file",
@@ -83,6 +156,99 @@ SR_TOOL_MULTI: ToolParam = {
 }
 
 
+# Directory of the optional on-disk inference cache; None disables caching
+_inference_cache_dir = None
+# Part of every cache key; bump it to invalidate all entries after changing how requests
+# are built somewhere the key can't see (e.g. the Gemini/OpenAI tool conversions)
+_INFERENCE_CACHE_VERSION = 2
+_inference_cache_stats = {"hits": 0, "misses": 0}
+_inference_cache_stats_lock = threading.Lock()
+
+
+def configure_inference_cache(cache_dir):
+    """Enable the on-disk cache of model edit responses in *cache_dir* (None disables it).
+
+    Also resets the hit/miss counts, so inference_cache_stats() covers one run.
+    """
+    global _inference_cache_dir
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    _inference_cache_dir = cache_dir
+    with _inference_cache_stats_lock:
+        _inference_cache_stats["hits"] = _inference_cache_stats["misses"] = 0
+
+
+def inference_cache_stats():
+    """Return the hit and miss counts since the cache was last configured."""
+    with _inference_cache_stats_lock:
+        return dict(_inference_cache_stats)
+
+
+def _inference_cached(fn):
+    """Persist *fn*'s JSON-able result on disk, keyed by SHA-256 of its name, arguments
+    and request fingerprint.
+
+    Only active once configure_inference_cache() has been given a directory. A cache
+    hit skips the model call entirely, so timings measured around it are not real.
+    """
+    # The request also depends on what fn writes inline (system prompts, tool_choice,
+    # max_tokens), the tool specs and the prompt templates; hash them all so editing any
+    # of them misses the cache instead of replaying responses to the old request
+    fingerprint = hashlib.sha256(
+        "\0".join(
+            (
+                str(_INFERENCE_CACHE_VERSION),
+                inspect.getsource(fn),
+                json.dumps([MORPH_TOOL, SR_TOOL_MULTI], sort_keys=True),
+                inspect.getsource(prompts),
+            )
+        ).encode()
+    ).hexdigest()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _inference_cache_dir is None:
+            return fn(*args, **kwargs)
+
+        key = hashlib.sha256(
+            json.dumps([fn.__name__, fingerprint, args, kwargs], sort_keys=True).encode()
+        ).hexdigest()
+        path = os.path.join(_inference_cache_dir, f"{key}.json")
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            # JSON has no tuples, so entries record whether the result was one; lists
+            # and everything else come back as stored
+            cached = tuple(entry["value"]) if entry["tuple"] else entry["value"]
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            pass
+        else:
+            with _inference_cache_stats_lock:
+                _inference_cache_stats["hits"] += 1
+            return cached
+
+        with _inference_cache_stats_lock:
+            _inference_cache_stats["misses"] += 1
+        result = fn(*args, **kwargs)
+
+        # Write to a private temp file then rename, so concurrent readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"tuple": isinstance(result, tuple), "value": result}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            # Don't leave a partial temp file behind (unserializable result, full disk)
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return result
+
+    return wrapper
+
+
 def _convert_tool_for_gemini(tool_def: dict) -> dict:
     """Convert our existing tool spec to Gemini function declaration format."""
     return {
@@ -92,6 +258,38 @@ def _convert_tool_for_gemini(tool_def: dict) -> dict:
     }
 
 
+@functools.lru_cache(maxsize=2)
+def _get_gemini_config(edit_type: str):
+    """Gemini request config exposing the morph or S&R tool as its only function.
+
+    The tools are static, so each config is built once, on first Gemini use.
+    """
+    from google.genai import types
+
+    tool_def = MORPH_TOOL if edit_type == "morph" else SR_TOOL_MULTI
+    function_declarations = [_convert_tool_for_gemini(tool_def)]
+    gemini_tool = types.Tool(function_declarations=function_declarations)
+    return types.GenerateContentConfig(tools=[gemini_tool])
+
+
+def _openai_tool_for(tool_def: dict) -> dict:
+    """Convert our existing tool spec to the OpenAI function-tool format."""
+    return {
+        "type": "function",
+        "function": {
+            "name": tool_def["name"],
+            "description": tool_def["description"],
+            "parameters": tool_def["input_schema"],
+        },
+    }
+
+
+# The tools are static, so build their OpenAI forms once rather than per call
+_OPENAI_MORPH_TOOL = _openai_tool_for(MORPH_TOOL)
+_OPENAI_SR_TOOL = _openai_tool_for(SR_TOOL_MULTI)
+
+
+@_inference_cached
 def get_single_turn_morph_edit(
     file_contents, request, model_id="claude-sonnet-4-20250514"
 ):
@@ -104,21 +302,13 @@ def get_single_turn_morph_edit(
 
     # Treat OpenAI models that are either prefixed with 'gpt' or shorthand like 'o3', 'o4-mini', this is some questionable code that might cause issues
     if model_id.startswith("o") or "gpt" in model_id:
-        openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        openai_tool = {
-            "type": "function",
-            "function": {
-                "name": tool["name"],
-                "description": tool["description"],
-                "parameters": tool["input_schema"],
-            },
-        }
+        openai_client = _get_openai_client()
 
         response, wait_time_ms = _retry_on_429(
             openai_client.chat.completions.create,
             model=model_id,
             messages=[{"role": "user", "content": prompt}],
-            tools=[openai_tool],
+            tools=[_OPENAI_MORPH_TOOL],
             tool_choice="required",
         )
 
@@ -139,13 +329,9 @@ def get_single_turn_morph_edit(
         # ------------------------------------------------------------------
         # Google Gemini path
         # ------------------------------------------------------------------
-        tool = MORPH_TOOL
-
-        function_declarations = [_convert_tool_for_gemini(tool)]
-        gemini_tool = types.Tool(function_declarations=function_declarations)
-        config = types.GenerateContentConfig(tools=[gemini_tool])
+        config = _get_gemini_config("morph")
 
-        genai_client = genai.Client()
+        genai_client = _get_genai_client()
 
         response, wait_time_ms = _retry_on_429(
             genai_client.models.generate_content,
@@ -175,10 +361,13 @@ def get_single_turn_morph_edit(
         raise ValueError("No tool call in Gemini response")
     else:
         stream, wait_time_ms = _retry_on_429(
-            client.messages.create,
+            _get_anthropic_client().messages.create,
             model=model_id,
             max_tokens=10000,
             tools=[tool],
+            # Force the edit_file call, as tool_choice="required" does for OpenAI, so the
+            # model doesn't spend output tokens on prose before (or instead of) the edit
+            tool_choice={"type": "tool", "name": tool["name"]},
             messages=[
                 {
                     "role": "user",
@@ -188,33 +377,28 @@ def get_single_turn_morph_edit(
             stream=True,
         )
 
-        json_string = ""
+        # Only tool-input deltas matter; check the event type before touching the delta
+        json_parts = []
 
         try:
             for event in stream:
-                delta = getattr(event, "delta", None)
-                if delta is None:
-                    continue
-
-                text = getattr(delta, "text", None)
-                if text is not None:
-                    continue
-
-                partial_json = getattr(delta, "partial_json", None)
-                if partial_json is not None:
-                    json_string += partial_json
-                    continue
+                if (
+                    event.type == "content_block_delta"
+                    and event.delta.type == "input_json_delta"
+                ):
+                    json_parts.append(event.delta.partial_json)
         finally:
             stream_end = time.time()
             # Subtract wait time from total time
             actual_time = (stream_end - stream_start) * 1000 - wait_time_ms
 
-        tool_call = json.loads(json_string)
+        tool_call = json.loads("".join(json_parts))
         # Count tokens in the visible output (the tool call JSON)
         token_count = count_tokens(json.dumps(tool_call))
         return tool_call, token_count
 
 
+@_inference_cached
 def apply_morph_edit(edit, initial_code):
     """Apply a morph edit using the Morph API.
     Returns: (edited_content, actual_apply_time_ms_excluding_wait)"""
@@ -224,7 +408,7 @@ def apply_morph_edit(edit, initial_code):
     edit_start = time.time()
 
     response, wait_time_ms = _retry_on_429(
-        client_morph.chat.completions.create,
+        _get_morph_client().chat.completions.create,
         model="morph-v3-large",
         messages=[
             {
@@ -255,11 +439,13 @@ def apply_sr_edit_multi_turn(edit: dict, initial_code: str):
     old_str = edit["old_string"]
     new_str = edit["new_string"]
 
-    occurrences = initial_code.count(old_str)
-    if occurrences != 1:
+    # old_string must occur exactly once; search past the first match (non-overlapping,
+    # like str.count) instead of counting the whole file and then replacing in a second scan
+    index = initial_code.find(old_str)
+    if index < 0 or initial_code.find(old_str, index + max(len(old_str), 1)) >= 0:
         return initial_code, False
 
-    return initial_code.replace(old_str, new_str, 1), True
+    return initial_code[:index] + new_str + initial_code[index + len(old_str) :], True
 
 
 def run_multi_turn_edits(
@@ -302,7 +488,9 @@ def run_multi_turn_edits(
         else:  # sr
             apply_start = time.time()
             updated_code, success = apply_sr_edit_multi_turn(tool_call, current_code)
-            if not success:
+            # A replacement with new_string == old_string changes nothing; stop like the
+            # morph branch does rather than spend another model turn on identical code
+            if not success or updated_code == current_code:
                 break
             current_code = updated_code
             apply_time = (
@@ -321,6 +509,7 @@ def run_multi_turn_edits(
     }
 
 
+@_inference_cached
 def get_full_file_generation(
     file_contents: str, request: str, model_id: str = "claude-sonnet-4-20250514"
 ):
@@ -331,7 +520,7 @@ def get_full_file_generation(
 
     # Handle different model types
     if model_id.startswith("o") or "gpt" in model_id:
-        openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        openai_client = _get_openai_client()
 
         # Some models (o3, o4-mini) don't support temperature=0
         kwargs = {
@@ -354,7 +543,7 @@ def get_full_file_generation(
         total_tokens = count_tokens(edited_content)
 
     elif "gemini" in model_id:
-        genai_client = genai.Client()
+        genai_client = _get_genai_client()
 
         response, wait_time_ms = _retry_on_429(
             genai_client.models.generate_content,
@@ -374,22 +563,21 @@ def get_full_file_generation(
         total_tokens = count_tokens(edited_content)
 
     else:  # Claude - use streaming for full file generation
-        edited_content = ""
-
         # Use streaming to avoid timeout for long responses
         stream, wait_time_ms = _retry_on_429(
-            client.messages.create,
+            _get_anthropic_client().messages.create,
             model=model_id,
             max_tokens=10000,
             messages=[{"role": "user", "content": prompt}],
             stream=True,
         )
 
-        for event in stream:
-            if hasattr(event, "delta"):
-                delta = event.delta
-                if hasattr(delta, "text") and delta.text:
-                    edited_content += delta.text
+        text_parts = [
+            event.delta.text
+            for event in stream
+            if event.type == "content_block_delta" and event.delta.type == "text_delta"
+        ]
+        edited_content = "".join(text_parts)
 
         generation_time = (
             time.time() - generation_start
@@ -410,65 +598,155 @@ def get_full_file_generation(
     }
 
 
+# JUDGMENT_PROMPT split where the per-edit part begins; formatting both halves gives
+# exactly JUDGMENT_PROMPT.format(...)
+_JUDGMENT_PREFIX, _JUDGMENT_SUFFIX = JUDGMENT_PROMPT.split("UPDATED CODE:", 1)
+_JUDGMENT_SUFFIX = "UPDATED CODE:" + _JUDGMENT_SUFFIX
+
+
+def _truncated_unified_diff(original_code, edited_code, max_diff_lines=500):
+    """Unified diff of the two files, keeping only the first max_diff_lines // 2 and the
+    last ceil(max_diff_lines / 2) lines when it is longer than max_diff_lines.
+
+    Streams the diff once, holding just the head and a bounded tail, instead of joining
+    the whole diff and splitting it again. Lines are counted on "\n" exactly like
+    "".join(diff).split("\n"), so the (lineterm="") header lines still run into the
+    line after them.
+    """
+    keep = max_diff_lines // 2
+    head = []
+    # Same split as diff_lines[:max // 2] + diff_lines[-max // 2:]: the tail gets the odd line
+    tail = deque(maxlen=max_diff_lines - keep)
+    num_lines = 0
+    current = ""
+    for piece in difflib.unified_diff(
+        original_code.splitlines(keepends=True),
+        edited_code.splitlines(keepends=True),
+        fromfile="original",
+        tofile="updated",
+        lineterm="",
+    ):
+        if not piece.endswith("\n"):
+            current += piece
+            continue
+        line = current + piece[:-1]
+        current = ""
+        (head if num_lines < keep else tail).append(line)
+        num_lines += 1
+    (head if num_lines < keep else tail).append(current)
+    num_lines += 1
+
+    if num_lines > max_diff_lines:
+        # Keep first and last parts of diff
+        return (
+            "\n".join(head)
+            + "\n\n... [diff truncated - "
+            + str(num_lines - max_diff_lines)
+            + " lines omitted] ...\n\n"
+            + "\n".join(tail)
+        )
+    return "\n".join(itertools.chain(head, tail))
+
+
 def verify_update(original_code, edited_code, update_instruction):
     """Verify if the update was correctly applied.
 
     For full file generation, the diff might be very large since the entire file
     is regenerated. The judge looks at both versions and the user request.
+    Returns None, not a verdict, if the judge call fails.
     """
-    diff_lines = list(
-        difflib.unified_diff(
-            original_code.splitlines(keepends=True),
-            edited_code.splitlines(keepends=True),
-            fromfile="original",
-            tofile="updated",
-            lineterm="",
-        )
-    )
-    unified_diff = "".join(diff_lines)
+    # An unchanged file can't satisfy an edit request; skip the diff and the judge
+    if original_code == edited_code:
+        return False
 
     # For very large diffs (full file generation), truncate to avoid token limits
-    max_diff_lines = 500
-    diff_lines_list = unified_diff.split("\n")
-    if len(diff_lines_list) > max_diff_lines:
-        # Keep first and last parts of diff
-        truncated_diff = (
-            "\n".join(diff_lines_list[: max_diff_lines // 2])
-            + "\n\n... [diff truncated - "
-            + str(len(diff_lines_list) - max_diff_lines)
-            + " lines omitted] ...\n\n"
-            + "\n".join(diff_lines_list[-max_diff_lines // 2 :])
-        )
-        unified_diff = truncated_diff
+    unified_diff = _truncated_unified_diff(original_code, edited_code, max_diff_lines=500)
 
-    prompt = JUDGMENT_PROMPT.format(
+    # The instructions and original code come first in the prompt and are shared by
+    # every model/method judged on the same query, so they form the cacheable prefix
+    prefix = _JUDGMENT_PREFIX.format(
         originalCode=original_code,
+        updateInstructions=update_instruction,
+    )
+    suffix = _JUDGMENT_SUFFIX.format(
         updatedCode=edited_code,
         unifiedDiff=unified_diff,
-        updateInstructions=update_instruction,
     )
 
     try:
-        response, _ = _retry_on_429(
-            client.messages.create,
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=1000,
-            messages=[{"role": "user", "content": prompt}],
-        )
+        return _judge_verdict(prefix, suffix)
+    except Exception:
+        return None
 
-        verdict = response.content[0].text.strip().lower()
-        return verdict.startswith("true")
 
-    except Exception:
-        return False
+@_inference_cached
+def _judge_verdict(prefix, suffix):
+    """Ask the judge model for a true/false verdict; errors propagate so they are never cached.
+
+    The prompt is prefix + suffix, sent as two text blocks with the prefix marked for
+    Anthropic prompt caching so repeated judgments of one query reuse it.
+    """
+    response, _ = _retry_on_429(
+        _get_anthropic_client().messages.create,
+        model="claude-3-7-sonnet-20250219",
+        max_tokens=1000,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prefix,
+                        "cache_control": {"type": "ephemeral"},
+                    },
+                    {"type": "text", "text": suffix},
+                ],
+            }
+        ],
+    )
+
+    verdict = response.content[0].text.strip().lower()
+    return verdict.startswith("true")
+
+
+# Backoff for _retry_on_429 when the server sends no Retry-After: exponential from
+# _RETRY_BASE_S, capped at _RETRY_CAP_S, plus up to _RETRY_JITTER_S of random jitter.
+# The SDKs already retry quickly on their own first, so a 429 that reaches us is a
+# sustained limit and the base is seconds, not milliseconds
+_RETRY_BASE_S = 5
+_RETRY_CAP_S = 120
+_RETRY_JITTER_S = 5
+# Server errors (5xx), dropped connections and timeouts are retried only this many
+# times, and 429s this many, so a limit that never clears (e.g. an exhausted quota)
+# fails the item instead of hanging its worker
+_MAX_TRANSIENT_RETRIES = 5
+_MAX_RATE_LIMIT_RETRIES = 8
+_TRANSIENT_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+def _retry_after_seconds(exc):
+    """Seconds from the Retry-After header of *exc*'s HTTP response, or None."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
 
 
 def _retry_on_429(callable_fn, *args, **kwargs):
-    """Invoke *callable_fn* with retry on HTTP 429.
+    """Invoke *callable_fn* with bounded retries on HTTP 429 and transient errors.
 
-    Returns tuple: (result, wait_time_ms) where wait_time_ms is the total time spent waiting for rate limits.
+    Honors Retry-After when the server sends it, otherwise backs off exponentially with
+    jitter. Returns tuple: (result, wait_time_ms) where wait_time_ms is the total time
+    spent sleeping between retries.
     """
     total_wait_time = 0
+    attempt = 0
+    rate_limit_errors = 0
+    transient_errors = 0
 
     while True:
         try:
@@ -476,15 +754,35 @@ def _retry_on_429(callable_fn, *args, **kwargs):
             return result, total_wait_time * 1000  # Convert to ms
         except Exception as exc:
             status = getattr(exc, "status_code", None)
-            if status == 429 or exc.__class__.__name__ == "RateLimitError":
-                delay = random.randint(120, 180)
-                print(f"Rate-limit (429) hit – sleeping {delay}s then retrying…")
-                time.sleep(delay)
-                total_wait_time += delay
-                continue
-            raise
-
-
+            if status is None and isinstance(getattr(exc, "code", None), int):
+                status = exc.code  # google-genai errors carry the HTTP status as .code
+            is_rate_limit = status == 429 or exc.__class__.__name__ == "RateLimitError"
+            is_transient = (
+                isinstance(status, int) and status >= 500
+            ) or exc.__class__.__name__ in _TRANSIENT_ERROR_NAMES
+            if is_rate_limit:
+                if rate_limit_errors >= _MAX_RATE_LIMIT_RETRIES:
+                    raise
+                rate_limit_errors += 1
+            elif is_transient and transient_errors < _MAX_TRANSIENT_RETRIES:
+                transient_errors += 1
+            else:
+                raise
+
+            delay = _retry_after_seconds(exc)
+            if delay is None:
+                delay = min(_RETRY_CAP_S, _RETRY_BASE_S * 2**attempt)
+                delay += random.uniform(0, _RETRY_JITTER_S)
+            else:
+                delay = min(delay, _RETRY_CAP_S)
+            attempt += 1
+            reason = f"HTTP {status}" if status else exc.__class__.__name__
+            logger.warning(f"{reason} – sleeping {delay:.1f}s then retrying…")
+            time.sleep(delay)
+            total_wait_time += delay
+
+
+@_inference_cached
 def get_multi_turn_edit(
     file_contents,
     request,
@@ -537,15 +835,7 @@ def get_multi_turn_edit(
 
     # Handle different model types
     if model_id.startswith("o") or "gpt" in model_id:
-        openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        openai_tool = {
-            "type": "function",
-            "function": {
-                "name": tool["name"],
-                "description": tool["description"],
-                "parameters": tool["input_schema"],
-            },
-        }
+        openai_client = _get_openai_client()
 
         response, wait_time_ms = _retry_on_429(
             openai_client.chat.completions.create,
@@ -554,7 +844,7 @@ def get_multi_turn_edit(
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt},
             ],
-            tools=[openai_tool],
+            tools=[_OPENAI_MORPH_TOOL if edit_type == "morph" else _OPENAI_SR_TOOL],
             tool_choice="auto",
         )
 
@@ -579,11 +869,9 @@ def get_multi_turn_edit(
             )
 
     elif "gemini" in model_id:
-        function_declarations = [_convert_tool_for_gemini(tool)]
-        gemini_tool = types.Tool(function_declarations=function_declarations)
-        config = types.GenerateContentConfig(tools=[gemini_tool])
+        config = _get_gemini_config(edit_type)
 
-        genai_client = genai.Client()
+        genai_client = _get_genai_client()
         full_prompt = system_prompt + "\n\n" + prompt
 
         response, wait_time_ms = _retry_on_429(
@@ -611,7 +899,7 @@ def get_multi_turn_edit(
 
     else:  # Claude
         stream, wait_time_ms = _retry_on_429(
-            client.messages.create,
+            _get_anthropic_client().messages.create,
             model=model_id,
             max_tokens=10000,
             tools=[tool],
@@ -620,19 +908,12 @@ def get_multi_turn_edit(
             stream=True,
         )
 
-        json_string = ""
-
-        for event in stream:
-            delta = getattr(event, "delta", None)
-            if delta is None:
-                continue
-            text = getattr(delta, "text", None)
-            if text is not None:
-                continue
-            partial_json = getattr(delta, "partial_json", None)
-            if partial_json is not None:
-                json_string += partial_json
-                continue
+        json_string = "".join(
+            event.delta.partial_json
+            for event in stream
+            if event.type == "content_block_delta"
+            and event.delta.type == "input_json_delta"
+        )
 
         actual_time = (time.time() - start_time) * 1000 - wait_time_ms
 
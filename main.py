@@ -19,6 +19,11 @@ def main():
     parser.add_argument(
         "--output-dir", type=str, default="results/", help="Directory to save results"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the models, even if use_inference_cache is set in the config",
+    )
 
     args = parser.parse_args()
 
@@ -28,7 +33,7 @@ def main():
         sys.exit(1)
 
     try:
-        runner = BenchmarkRunner(str(config_path))
+        runner = BenchmarkRunner(str(config_path), use_inference_cache=not args.no_cache)
         csv_file, log_file, summary = runner.run_all_benchmarks()
 
         print("\nBenchmark completed successfully!")